@@ -0,0 +1,64 @@
+"""Time the metadata getters of already opened books.
+
+Usage: python benchmarks/bench_getters.py [--compare] book.epub [book.fb2 ...]
+
+File I/O is done once per book, so the numbers show the cost of the
+tree queries themselves. Formats with a single pass get_fields() are
+timed both ways.
+
+With --compare the getters are timed a second time with every query
+run as tree.xpath(str, namespaces=...), the way they were run before
+the expressions were compiled and cached, and the saving is printed.
+"""
+import sys
+import timeit
+
+from ebookmeta import epub2, fb2
+from ebookmeta.formats import open_ebook
+
+GETTERS = ('get_identifier', 'get_title', 'get_author_list', 'get_series', 'get_series_index',
+           'get_lang', 'get_description', 'get_tag_list', 'get_translator_list')
+
+
+def read_all(ebook):
+    for getter in GETTERS:
+        getattr(ebook, getter)()
+
+
+def time_getters(ebook, number):
+    return min(timeit.repeat(lambda: read_all(ebook), number=number, repeat=5)) / number * 1e6
+
+
+def uncompiled_xpath():
+    # Replace the compiled expression caches with string queries, returns a function undoing it
+    saved = (epub2._xpath, fb2._xpath)
+    epub2._xpath = lambda xpath_str: lambda tree: tree.xpath(xpath_str, namespaces=epub2.ns_map)
+    fb2._xpath = lambda xpath_str, namespaces: lambda tree: tree.xpath(xpath_str, namespaces=dict(namespaces))
+
+    def restore():
+        epub2._xpath, fb2._xpath = saved
+    return restore
+
+
+def main(files, compare=False, number=2000):
+    for file in files:
+        ebook = open_ebook(file)
+        compiled = time_getters(ebook, number)
+        print('{0}: {1:.1f} us per book'.format(file, compiled))
+        if compare:
+            restore = uncompiled_xpath()
+            try:
+                uncompiled = time_getters(ebook, number)
+            finally:
+                restore()
+            print('{0}: {1:.1f} us per book, tree.xpath(str), {2:.1f} us saved'.format(
+                file, uncompiled, uncompiled - compiled))
+        if hasattr(ebook, 'get_fields'):
+            seconds = min(timeit.repeat(ebook.get_fields, number=number, repeat=5))
+            print('{0}: {1:.1f} us per book, get_fields()'.format(file, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    compare = '--compare' in args
+    main([arg for arg in args if arg != '--compare'], compare)
@@ -1,82 +1,150 @@
+import os
+import importlib
+
 from .metadata import Metadata
-from .exceptions import BadFormat, UnknownFormatException
-from .fb2 import Fb2
-from .epub2 import Epub2
-from .epub3 import Epub3
-from .utils import get_file_creation_time, get_file_modified_time
+from .exceptions import BadFormat, UnknownFormatException, UnknownFieldException
+from .formats import open_ebook, detect_format, register_format
+from .utils import get_file_creation_time, get_file_modified_time, same_file
 
-__all__ = ['get_metadata', 'set_metadata', 'Metadata', 'get_filename_from_pattern']
+__all__ = ['get_metadata', 'set_metadata', 'Metadata', 'get_filename_from_pattern', 'FIELDS',
+           'get_metadata_many', 'BatchResult', 'aget_metadata', 'aset_metadata', 'aget_metadata_many',
+           'scan', 'DiskCache', 'MemoryCache', 'detect_format', 'register_format']
 
 
 def _get_ebook(file):
-    ebook = None
-    
-    if file.lower().endswith(('.fb2', '.zip')):
-        ebook = Fb2(file)
+    return open_ebook(file)
+
+
+def __getattr__(name):
+    # Format handlers are imported on first use
+    if name in ('Fb2', 'Epub2', 'Epub3'):
+        module = importlib.import_module('.' + name.lower(), __name__)
+        return getattr(module, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+FIELDS = ('identifier', 'title', 'author_list', 'series', 'series_index', 'lang', 'description',
+          'tag_list', 'translator_list', 'cover', 'publish_info', 'file_created', 'file_modified')
+
+_COVER_FIELDS = ('cover', 'cover_image_data', 'cover_file_name', 'cover_media_type')
+
+_getters = {
+    'identifier': 'get_identifier',
+    'title': 'get_title',
+    'author_list': 'get_author_list',
+    'series': 'get_series',
+    'series_index': 'get_series_index',
+    'lang': 'get_lang',
+    'description': 'get_description',
+    'tag_list': 'get_tag_list',
+    'translator_list': 'get_translator_list',
+}
+
+_setters = {
+    'title': 'set_title',
+    'author_list': 'set_author_list',
+    'series': 'set_series',
+    'series_index': 'set_series_index',
+    'lang': 'set_lang',
+    'tag_list': 'set_tag_list',
+    'translator_list': 'set_translator_list',
+}
+
+_walked_fields = set(_getters).union(['publish_info'])
 
-    elif file.lower().endswith('.epub'):
-        ebook = Epub2(file)
-        if ebook.version[:1] == '3':
-            ebook = Epub3(file)
-    else:
-       raise UnknownFormatException 
 
-    return ebook
+def _check_fields(fields):
+    if fields is None:
+        return set(FIELDS)
+    fields = set(fields)
+    unknown = fields.difference(FIELDS, _COVER_FIELDS)
+    if unknown:
+        raise UnknownFieldException('Unknown metadata fields: {}'.format(', '.join(sorted(unknown))))
+    if fields.intersection(_COVER_FIELDS):
+        fields.add('cover')
+    return fields
 
 
-def get_metadata(file):
+def get_metadata(file, fields=None):
+    return _get_metadata(file, _check_fields(fields))
+
+
+def _get_metadata(file, fields, st=None):
     ebook = _get_ebook(file)
-    meta = Metadata()
-
-    meta.identifier = ebook.get_identifier()
-    meta.title = ebook.get_title()
-    meta.author_list = ebook.get_author_list()
-    meta.series = ebook.get_series()
-    meta.series_index = ebook.get_series_index()
-    meta.lang = ebook.get_lang()
-    meta.description = ebook.get_description()
-    meta.tag_list = ebook.get_tag_list()
-    meta.translator_list = ebook.get_translator_list()
-    (meta.cover_file_name, meta.cover_media_type, meta.cover_image_data) = ebook.get_cover_data()
-    meta.format = ebook.get_format()
-    meta.format_version = ebook.get_format_version()
-    meta.file = file
-    meta.file_created = get_file_creation_time(file)
-    meta.file_modified = get_file_modified_time(file)
-
-    # Get publish info for FB2
-    if meta.format == 'fb2':
-        meta.publish_info.title = ebook.get_publish_title()
-        meta.publish_info.publisher = ebook.get_publish_publisher()
-        meta.publish_info.city = ebook.get_publish_city()
-        meta.publish_info.year = ebook.get_publish_year()
-        meta.publish_info.series = ebook.get_publish_series()
-        meta.publish_info.series_index = ebook.get_publish_series_index()
-        meta.publish_info.isbn = ebook.get_publish_isbn()
-   
-    return meta
-
-def set_metadata(file, meta):
+    # The archive is released also on errors, the cover loader reopens it on demand
+    with ebook:
+        meta = Metadata()
+        meta._fields = fields
+
+        # Formats that can read all fields in one pass provide get_fields(), the others are asked field by field
+        values = {}
+        if hasattr(ebook, 'get_fields') and not fields.isdisjoint(_walked_fields):
+            values = ebook.get_fields(fields)
+        for field, getter in _getters.items():
+            if field in fields:
+                setattr(meta, field, values[field] if field in values else getattr(ebook, getter)())
+        if 'cover' in fields:
+            meta.set_cover_loader(ebook.get_cover_data)
+        meta.format = ebook.get_format()
+        meta.format_version = ebook.get_format_version()
+        if isinstance(file, str):
+            meta.file = file
+            if 'file_created' in fields or 'file_modified' in fields:
+                if st is None:
+                    st = os.stat(file)
+                if 'file_created' in fields:
+                    meta.file_created = get_file_creation_time(file, st)
+                if 'file_modified' in fields:
+                    meta.file_modified = get_file_modified_time(file, st)
+
+        # Get publish info for FB2
+        if meta.format == 'fb2' and 'publish_info' in fields:
+            if 'publish_info' in values:
+                vars(meta.publish_info).update(values['publish_info'])
+            else:
+                meta.publish_info.title = ebook.get_publish_title()
+                meta.publish_info.publisher = ebook.get_publish_publisher()
+                meta.publish_info.city = ebook.get_publish_city()
+                meta.publish_info.year = ebook.get_publish_year()
+                meta.publish_info.series = ebook.get_publish_series()
+                meta.publish_info.series_index = ebook.get_publish_series_index()
+                meta.publish_info.isbn = ebook.get_publish_isbn()
+
+        return meta
+
+def set_metadata(file, meta, output=None, patch=False):
     ebook = _get_ebook(file)
+    with ebook:
+        # Fields neither read nor changed are not written, the book keeps its own values
+        fields = meta._written_fields()
+        if fields is None:
+            fields = set(FIELDS)
+        for field, setter in _setters.items():
+            if field in fields:
+                getattr(ebook, setter)(getattr(meta, field))
+        # A cover not changed since it was read from this book (bytes and streams have no name to
+        # tell otherwise) is left as it is, and a lazy one is not even loaded
+        cover_kept = not meta._cover_changed() and (meta.file is None or same_file(meta.file, file))
+        if 'cover' in fields and not cover_kept:
+            ebook.set_cover_data(meta.cover_file_name, meta.cover_media_type, meta.cover_image_data)
+
+        # Set publish info for FB2
+        if meta.format == 'fb2' and 'publish_info' in fields:
+            ebook.set_publish_title(meta.publish_info.title)
+            ebook.set_publish_publisher(meta.publish_info.publisher)
+            ebook.set_publish_city(meta.publish_info.city) 
+            ebook.set_publish_year(meta.publish_info.year)
+            ebook.set_publish_series(meta.publish_info.series)
+            ebook.set_publish_series_index(meta.publish_info.series_index)
+            ebook.set_publish_isbn(meta.publish_info.isbn)
+
+        # Formats that can patch a file in place do so on request, the others write it anew
+        if patch and output is None and hasattr(ebook, 'patch'):
+            return ebook.patch()
+        return ebook.save(output)
 
-    ebook.set_title(meta.title)
-    ebook.set_author_list(meta.author_list)
-    ebook.set_series(meta.series)
-    ebook.set_series_index(meta.series_index)
-    ebook.set_lang(meta.lang)
-    ebook.set_tag_list(meta.tag_list)
-    ebook.set_translator_list(meta.translator_list)
-    ebook.set_cover_data(meta.cover_file_name, meta.cover_media_type, meta.cover_image_data)
-
-    # Set publish info for FB2
-    if meta.format == 'fb2':
-        ebook.set_publish_title(meta.publish_info.title)
-        ebook.set_publish_publisher(meta.publish_info.publisher)
-        ebook.set_publish_city(meta.publish_info.city) 
-        ebook.set_publish_year(meta.publish_info.year)
-        ebook.set_publish_series(meta.publish_info.series)
-        ebook.set_publish_series_index(meta.publish_info.series_index)
-        ebook.set_publish_isbn(meta.publish_info.isbn)
-   
-    ebook.save()
 
+from .batch import BatchResult, get_metadata_many
+from .aio import aget_metadata, aset_metadata, aget_metadata_many
+from .scanner import scan
+from .cache import DiskCache, MemoryCache
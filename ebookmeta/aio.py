@@ -0,0 +1,59 @@
+import asyncio
+import functools
+import weakref
+
+from . import get_metadata, set_metadata
+from .batch import BatchResult
+
+DEFAULT_LIMIT = 32
+
+# asyncio.Semaphore is bound to the loop it is used in, so keep one per loop
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _get_semaphore(semaphore):
+    if semaphore is not None:
+        return semaphore
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(DEFAULT_LIMIT)
+    return _semaphores[loop]
+
+
+async def _run(func, *args, executor=None, semaphore=None):
+    async with _get_semaphore(semaphore):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+
+async def aget_metadata(file, fields=None, executor=None, semaphore=None):
+    return await _run(get_metadata, file, fields, executor=executor, semaphore=semaphore)
+
+
+async def aset_metadata(file, meta, output=None, patch=False, executor=None, semaphore=None):
+    return await _run(set_metadata, file, meta, output, patch, executor=executor, semaphore=semaphore)
+
+
+async def aget_metadata_many(files, fields=None, executor=None, semaphore=None, limit=DEFAULT_LIMIT):
+    async def read(file):
+        try:
+            return BatchResult(file, meta=await aget_metadata(file, fields, executor, semaphore))
+        except Exception as e:
+            return BatchResult(file, error=e)
+
+    files = iter(files)
+    pending = set()
+    try:
+        for file in files:
+            pending.add(asyncio.ensure_future(read(file)))
+            if len(pending) >= limit:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
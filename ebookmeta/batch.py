@@ -0,0 +1,86 @@
+import os
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+
+from . import FIELDS, get_metadata, _check_fields
+from .exceptions import Error
+
+
+class BatchResult:
+    def __init__(self, file, meta=None, error=None):
+        self.file = file
+        self.meta = meta
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        if self.ok:
+            return '[file: {0}, meta: {1}]'.format(self.file, self.meta)
+        return '[file: {0}, error: {1!r}]'.format(self.file, self.error)
+
+
+def _init_worker():
+    # Pay for importing lxml and the package once per worker, not per chunk
+    import lxml.etree
+    import ebookmeta
+
+
+def _picklable(e):
+    try:
+        pickle.dumps(e)
+        return True
+    except Exception:
+        return False
+
+
+def _read_chunk(chunk, fields):
+    result = []
+    for file in chunk:
+        try:
+            result.append(BatchResult(file, meta=get_metadata(file, fields)))
+        except Exception as e:
+            result.append(BatchResult(file, error=e if _picklable(e) else Error(repr(e))))
+    return result
+
+
+def get_metadata_many(files, fields=None, workers=None, chunksize=16, ordered=True):
+    # A cover is decoded in the worker and pickled back in full, so it is read only when asked for
+    fields = _check_fields(fields if fields is not None else set(FIELDS).difference(['cover']))
+    workers = workers or os.cpu_count() or 1
+    files = iter(files)
+    # Keep a bounded number of chunks in flight, so huge file lists are not queued at once
+    max_pending = workers * 2
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        pending = deque()
+
+        def submit():
+            chunk = list(islice(files, chunksize))
+            if chunk:
+                pending.append(executor.submit(_read_chunk, chunk, fields))
+                return True
+            return False
+
+        try:
+            while len(pending) < max_pending and submit():
+                pass
+
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                for future in done:
+                    submit()
+                    for result in future.result():
+                        yield result
+        finally:
+            for future in pending:
+                future.cancel()
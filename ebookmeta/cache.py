@@ -0,0 +1,251 @@
+import os
+import json
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
+
+from . import set_metadata, _get_ebook, _get_metadata, _check_fields
+from .metadata import Metadata
+from .utils import get_file_creation_time, get_file_modified_time
+
+_VALUES = ('identifier', 'title', 'author_list', 'author_sort_list', 'translator_list', 'series',
+           'series_index', 'tag_list', 'description', 'lang', 'format', 'format_version')
+
+
+def _to_json(meta):
+    d = {key: getattr(meta, key) for key in _VALUES}
+    d['publish_info'] = vars(meta.publish_info)
+    return json.dumps(d, ensure_ascii=False)
+
+
+def _from_json(data):
+    d = json.loads(data)
+    meta = Metadata()
+    for key in _VALUES:
+        setattr(meta, key, d[key])
+    meta.publish_info.__dict__.update(d['publish_info'])
+    return meta
+
+
+def _read_cover(file):
+    with _get_ebook(file) as ebook:
+        return ebook.get_cover_data()
+
+
+class DiskCache:
+    def __init__(self, path, store_covers=False):
+        self.path = path
+        self.store_covers = store_covers
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def get_metadata(self, file, fields=None):
+        fields = _check_fields(fields)
+        key = os.path.abspath(file)
+        st = os.stat(file)
+
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT size, mtime_ns, data, has_cover FROM metadata WHERE path = ?', (key,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            meta = _from_json(row[2])
+            if 'cover' in fields:
+                if row[3]:
+                    meta.set_cover_loader(functools.partial(self._load_cover, key))
+                else:
+                    meta.set_cover_loader(functools.partial(_read_cover, file))
+            meta.file = file
+            if 'file_created' in fields:
+                meta.file_created = get_file_creation_time(file, st)
+            if 'file_modified' in fields:
+                meta.file_modified = get_file_modified_time(file, st)
+        else:
+            # Entries always hold every field, whatever subset was asked for
+            meta = _get_metadata(file, _check_fields(None), st)
+            cover = None
+            if self.store_covers:
+                cover = (meta.cover_file_name, meta.cover_media_type, meta.cover_image_data)
+            self._store(key, st, meta, cover)
+        meta._fields = fields
+        return meta
+
+    def set_metadata(self, file, meta, output=None, patch=False):
+        try:
+            return set_metadata(file, meta, output, patch)
+        finally:
+            self.invalidate(file)
+
+    def invalidate(self, file):
+        key = os.path.abspath(file)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('DELETE FROM metadata WHERE path = ?', (key,))
+                conn.execute('DELETE FROM cover WHERE path = ?', (key,))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _store(self, key, st, meta, cover):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO metadata (path, size, mtime_ns, data, has_cover) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             (key, st.st_size, st.st_mtime_ns, _to_json(meta), cover is not None))
+                if cover is not None:
+                    conn.execute('INSERT OR REPLACE INTO cover (path, file_name, media_type, data) '
+                                 'VALUES (?, ?, ?, ?)', (key,) + cover)
+                else:
+                    conn.execute('DELETE FROM cover WHERE path = ?', (key,))
+
+    def _load_cover(self, key):
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT file_name, media_type, data FROM cover WHERE path = ?', (key,)).fetchone()
+        if row is None:
+            return (None, None, None)
+        return (row[0], row[1], bytes(row[2]) if row[2] is not None else None)
+
+    def _connection(self):
+        # A connection must not be shared with a forked child, open a new one there
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._pid = os.getpid()
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            with self._conn:
+                self._conn.execute('CREATE TABLE IF NOT EXISTS metadata (path TEXT PRIMARY KEY, '
+                                   'size INTEGER, mtime_ns INTEGER, data TEXT, has_cover INTEGER)')
+                self._conn.execute('CREATE TABLE IF NOT EXISTS cover (path TEXT PRIMARY KEY, '
+                                   'file_name TEXT, media_type TEXT, data BLOB)')
+        return self._conn
+
+
+class MemoryCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_cover_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_cover_bytes = max_cover_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.cover_hits = 0
+        self.cover_misses = 0
+        self.cover_evictions = 0
+        self._lock = threading.Lock()
+        # Entries are serialized metadata, so every hit returns a fresh Metadata and the size is known
+        self._entries = OrderedDict()
+        self._covers = OrderedDict()
+        self._bytes = 0
+        self._cover_bytes = 0
+
+    def get_metadata(self, file, fields=None):
+        fields = _check_fields(fields)
+        key = os.path.abspath(file)
+        st = os.stat(file)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+
+        if entry is not None:
+            meta = _from_json(entry[2])
+            loader = functools.partial(_read_cover, file)
+            meta.file = file
+            if 'file_created' in fields:
+                meta.file_created = get_file_creation_time(file, st)
+            if 'file_modified' in fields:
+                meta.file_modified = get_file_modified_time(file, st)
+        else:
+            meta = _get_metadata(file, _check_fields(None), st)
+            loader = meta._cover_loader
+            # Kept as UTF-8, so max_bytes bounds bytes and not characters
+            data = _to_json(meta).encode('utf-8')
+            with self._lock:
+                self._bytes -= self._pop(self._entries, key)
+                self._entries[key] = (st.st_size, st.st_mtime_ns, data, len(data))
+                self._bytes += len(data)
+                self._bytes, self.evictions = self._evict(self._entries, self._bytes, self.max_bytes,
+                                                          self.evictions)
+
+        if 'cover' in fields:
+            meta.set_cover_loader(functools.partial(self._get_cover, key, st, loader))
+        else:
+            meta.set_cover_loader(None)
+        meta._fields = fields
+        return meta
+
+    def set_metadata(self, file, meta, output=None, patch=False):
+        try:
+            return set_metadata(file, meta, output, patch)
+        finally:
+            self.invalidate(file)
+
+    def invalidate(self, file):
+        key = os.path.abspath(file)
+        with self._lock:
+            self._bytes -= self._pop(self._entries, key)
+            self._cover_bytes -= self._pop(self._covers, key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._covers.clear()
+            self._bytes = 0
+            self._cover_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'bytes': self._bytes,
+                    'cover_hits': self.cover_hits, 'cover_misses': self.cover_misses,
+                    'cover_evictions': self.cover_evictions, 'covers': len(self._covers),
+                    'cover_bytes': self._cover_bytes}
+
+    def _get_cover(self, key, st, loader):
+        with self._lock:
+            entry = self._covers.get(key)
+            if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                self._covers.move_to_end(key)
+                self.cover_hits += 1
+                return entry[2]
+            self.cover_misses += 1
+
+        cover = loader()
+        size = len(cover[2] or b'')
+        with self._lock:
+            self._cover_bytes -= self._pop(self._covers, key)
+            if size <= self.max_cover_bytes:
+                self._covers[key] = (st.st_size, st.st_mtime_ns, cover, size)
+                self._cover_bytes += size
+                self._cover_bytes, self.cover_evictions = self._evict(
+                    self._covers, self._cover_bytes, self.max_cover_bytes, self.cover_evictions)
+        return cover
+
+    def _pop(self, entries, key):
+        entry = entries.pop(key, None)
+        return entry[3] if entry is not None else 0
+
+    def _evict(self, entries, total, limit, evictions):
+        while total > limit and entries:
+            _, entry = entries.popitem(last=False)
+            total -= entry[3]
+            evictions += 1
+        return total, evictions
+
@@ -1,11 +1,14 @@
 import os
 import posixpath
-import tempfile
-import shutil
 import urllib.parse
-from lxml import etree, html
-from .myzipfile import ZipFile, is_zipfile, ZIP_DEFLATED, ZIP_STORED
-from .utils import xstr
+import functools
+import time
+from io import BytesIO
+from lxml import etree
+from .myzipfile import ZipFile, ZipInfo, BadZipFile, ZIP_DEFLATED, ZIP_STORED
+from .utils import xstr, first_text, select_fields, replace_file, same_file
+
+READ_CHUNK_SIZE = 64 * 1024
 
 ns_map = {
         'n': 'urn:oasis:names:tc:opendocument:xmlns:container',
@@ -13,6 +16,54 @@ ns_map = {
         'dc': 'http://purl.org/dc/elements/1.1/'
     }
 
+
+@functools.lru_cache(maxsize=None)
+def _xpath(xpath_str):
+    # Compiled once per expression and shared by all books
+    return etree.XPath(xpath_str, namespaces=ns_map)
+
+
+_DC = '{%s}' % ns_map['dc']
+_OPF = '{%s}' % ns_map['opf']
+_OPF_ROLE = _OPF + 'role'
+
+
+class _ImageTarget():
+    # Parser target that keeps the first <img src> or <image xlink:href> of an HTML document
+    def __init__(self):
+        self.href = None
+
+    def start(self, tag, attrib):
+        if self.href is None:
+            if tag == 'img' and 'src' in attrib:
+                self.href = attrib['src']
+            elif tag == 'image' and 'xlink:href' in attrib:
+                self.href = attrib['xlink:href']
+
+    def close(self):
+        return self.href
+
+
+class _Manifest():
+    # Manifest items of an OPF by id, href, property and media type, and the spine in reading order
+    def __init__(self, tree):
+        self.by_id = {}
+        self.by_href = {}
+        self.by_property = {}
+        self.by_media_type = {}
+        self.spine = []
+
+        for item in _xpath('opf:manifest/opf:item')(tree):
+            self.by_id.setdefault(item.get('id'), item)
+            self.by_href.setdefault(item.get('href'), item)
+            for prop in item.get('properties', '').split():
+                self.by_property.setdefault(prop, []).append(item)
+            self.by_media_type.setdefault(item.get('media-type'), []).append(item)
+        for idref in _xpath('opf:spine/opf:itemref/@idref')(tree):
+            if idref in self.by_id:
+                self.spine.append(self.by_id[idref])
+
+
 class Epub2():
     def __init__(self, file):
         self.file = file
@@ -22,19 +73,30 @@ class Epub2():
         self.version = None
         self.cover_href = None
         self.cover_data = None
-        
-        if not is_zipfile(self.file):
+        self.zip = None
+        self._manifest = None
+
+        try:
+            self.zip = ZipFile(self.file)
+        except BadZipFile:
             raise Exception('"{}" is not epub file.'.format(self.file))
-        
+
         content = self._get_file_content('META-INF/container.xml')
         tree = etree.fromstring(content)
-        self.opf = tree.xpath('n:rootfiles/n:rootfile/@full-path', namespaces=ns_map)[0]
+        self.opf = _xpath('n:rootfiles/n:rootfile/@full-path')(tree)[0]
         self.content_root = os.path.dirname(self.opf) + '/'
         if self.content_root == '/':
             self.content_root = ''
         content = self._get_file_content(self.opf)
         self.tree = etree.fromstring(content)
-        self.version = self.tree.xpath('/opf:package/@version', namespaces=ns_map)[0]
+        self.version = _xpath('/opf:package/@version')(self.tree)[0]
+
+    @classmethod
+    def from_epub(cls, ebook):
+        # Take over the open archive and the parsed OPF of another Epub2 object
+        result = cls.__new__(cls)
+        result.__dict__.update(ebook.__dict__)
+        return result
 
     ########## Getters ##########
     def get_title(self):
@@ -99,7 +161,7 @@ class Epub2():
         if node is not None:
             if 'content' in node.attrib: cover_id = node.attrib['content']
         if cover_id:
-            node = self._get('opf:manifest/opf:item[@id="{0}"]'.format(cover_id))
+            node = self._get_manifest().by_id.get(cover_id)
             if node is not None:
                 if 'href' in node.attrib: href = node.attrib['href']
                 if 'media-type' in node.attrib: media_type = node.attrib['media-type']
@@ -108,42 +170,76 @@ class Epub2():
             (href, media_type, data) = self._get_cover_from_first_element()
         return (href, media_type, data)
 
+    def get_fields(self, fields=None):
+        # With fields given only those are returned, the creators are sorted out only if asked for
+        values, titles, creators, _ = self._walk_metadata()
+        values['title'] = xstr(titles[0].text) if titles else None
+        if fields is None or 'author_list' in fields:
+            values['author_list'] = [xstr(node.text) for node in creators if node.get(_OPF_ROLE) in ('aut', None)]
+        if fields is None or 'translator_list' in fields:
+            values['translator_list'] = [xstr(node.text) for node in creators if node.get(_OPF_ROLE) == 'trl']
+        return select_fields(values, fields)
+
+    def _walk_metadata(self):
+        # One pass over the <metadata> children gives every field the single getters return,
+        # titles and creators are left to the caller together with the refines of each id
+        fields = {'identifier': '', 'series': None, 'series_index': None, 'lang': None,
+                  'description': '', 'tag_list': []}
+        titles = []
+        creators = []
+        refines = {}
+        seen = set()
+        for node in self._get_all('opf:metadata/*'):
+            tag = node.tag
+            if tag == _DC + 'title':
+                titles.append(node)
+            elif tag == _DC + 'creator':
+                creators.append(node)
+            elif tag == _DC + 'subject':
+                fields['tag_list'].append(xstr(node.text))
+            elif tag == _DC + 'language':
+                if 'lang' not in seen:
+                    seen.add('lang')
+                    fields['lang'] = xstr(node.text)
+            elif tag in (_DC + 'description', _DC + 'identifier'):
+                key = tag[len(_DC):]
+                if key not in seen:
+                    text = first_text(node)
+                    if text is not None:
+                        seen.add(key)
+                        fields[key] = text
+            elif tag == _OPF + 'meta':
+                name = node.get('name')
+                key = {'calibre:series': 'series', 'calibre:series_index': 'series_index'}.get(name)
+                if key is not None and key not in seen:
+                    seen.add(key)
+                    if 'content' in node.attrib:
+                        fields[key] = xstr(node.attrib['content'])
+                if 'refines' in node.attrib:
+                    refines.setdefault(node.attrib['refines'], []).append(node)
+        return fields, titles, creators, refines
+
     def _get_cover_from_first_element(self):
         media_type = None
         href = None
         img_href = None
         data = None
 
-        nodes = self._get_all('opf:manifest/opf:item')
-        for node in nodes:
-            if node is not None:
-                if 'media-type' in node.attrib: 
-                    if node.attrib['media-type'] == 'application/xhtml+xml':
-                        media_type = node.attrib['media-type']
-                        break
+        # The first document in reading order, manifest order is only used when there is no spine
+        manifest = self._get_manifest()
+        for node in manifest.spine or manifest.by_media_type.get('application/xhtml+xml', []):
+            if node.get('media-type') == 'application/xhtml+xml':
+                media_type = node.attrib['media-type']
+                break
 
         if media_type:
-            href = node.attrib['href'] 
+            href = node.get('href')
             if href:
-                content = self._get_file_content(self.content_root + urllib.parse.unquote(href))
-                tree = html.fromstring(content)
-                nodes = tree.xpath('//img')
-                for node in nodes:
-                    if 'src' in node.attrib:
-                        img_href = node.attrib['src']
-                        if img_href.lower().endswith(('.jpg', '.jpeg')): media_type = 'image/jpeg'
-                        elif img_href.lower().endswith(('.png')): media_type = 'image/png'
-                        else: media_type = None
-                        break
-                if not img_href:
-                    nodes = tree.xpath('//image')
-                    for node in nodes:
-                        if 'xlink:href' in node.attrib:
-                            img_href = node.attrib['xlink:href']
-                            if img_href.lower().endswith(('.jpg', '.jpeg')): media_type = 'image/jpeg'
-                            elif img_href.lower().endswith(('.png')): media_type = 'image/png'
-                            else: media_type = None
-                            break
+                img_href = self._find_first_image(self.content_root + urllib.parse.unquote(href))
+                if img_href:
+                    if img_href.lower().endswith(('.jpg', '.jpeg')): media_type = 'image/jpeg'
+                    elif img_href.lower().endswith(('.png')): media_type = 'image/png'
+                    else: media_type = None
 
                 if media_type and img_href:
                     base_path = posixpath.join(self.content_root, os.path.dirname(href))
@@ -152,6 +248,20 @@ class Epub2():
                     return (img_path, media_type, data)
         return (None, None, None)
 
+    def _find_first_image(self, filename):
+        # The document is parsed as it is decompressed and reading stops at the first image
+        target = _ImageTarget()
+        parser = etree.HTMLParser(target=target)
+        with self._get_zip().open(filename) as stream:
+            for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b''):
+                parser.feed(chunk)
+                if target.href is not None:
+                    return target.href
+        try:
+            return parser.close()
+        except etree.XMLSyntaxError:
+            return target.href
+
     ########## Setters ##########
     def set_title(self, title):
         node = self._get('opf:metadata/dc:title')
@@ -229,11 +339,65 @@ class Epub2():
             self.cover_data = data
 
     ########## Service methods ##########
-    def save(self):
-        temp_dir = tempfile.mkdtemp(prefix='em')
-        dest_file = os.path.join(temp_dir, os.path.basename(self.file))
-        src_zip = ZipFile(self.file, mode='r')
-        dest_zip = ZipFile(dest_file, mode='w')
+    def save(self, output=None):
+        if output is None and not isinstance(self.file, str):
+            output = BytesIO()
+            self._write(output)
+            return output.getvalue()
+        if output is not None and not same_file(self.file, output):
+            self._write(output)
+            return
+        self._save_in_place(self._write)
+
+    def patch(self):
+        # Append the new OPF and cover to the archive and rewrite only its central directory.
+        # The replaced entries stay in the file as dead bytes until compact() is called.
+        if not isinstance(self.file, str):
+            return self.save()
+        opf_data = etree.tostring(self.tree, encoding='utf-8', method='xml', xml_declaration=True,
+                                  pretty_print=True)
+        self.close()
+        with open(self.file, 'r+b') as f:
+            with ZipFile(f, mode='a') as zipfile:
+                self._replace_entry(zipfile, self.opf, opf_data)
+                if self.cover_data:
+                    self._replace_entry(zipfile, self.content_root + urllib.parse.unquote(self.cover_href),
+                                        self.cover_data)
+            f.truncate()
+
+    def compact(self):
+        # Rewrite the archive with the members it lists, dropping the space left behind by patch()
+        self._save_in_place(self._write_raw)
+
+    def _save_in_place(self, write):
+        def write_and_close(f):
+            write(f)
+            # The source is about to be replaced, the open session becomes stale
+            self.close()
+
+        try:
+            replace_file(self.file, write_and_close)
+        except Exception as e:
+            raise Exception(repr(e))
+
+    def _replace_entry(self, zipfile, name, data):
+        old_info = zipfile.NameToInfo.pop(name, None)
+        if old_info is None:
+            return
+        zipfile.filelist.remove(old_info)
+        info = ZipInfo(name, date_time=time.localtime(time.time())[:6])
+        info.external_attr = old_info.external_attr
+        zipfile.writestr(info, data, ZIP_DEFLATED)
+
+    def _write_raw(self, dest):
+        src_zip = self._get_zip()
+        with ZipFile(dest, mode='w') as dest_zip:
+            for f in src_zip.infolist():
+                dest_zip.copyraw(src_zip, f)
+
+    def _write(self, dest):
+        src_zip = self._get_zip()
+        dest_zip = ZipFile(dest, mode='w')
         try:
             for f in src_zip.infolist():
                 if f.filename == self.opf:
@@ -247,29 +411,41 @@ class Epub2():
                     buf = src_zip.read(f)
                     dest_zip.writestr(f.filename, buf, ZIP_STORED)
                 else:
-                    buf = src_zip.read(f)
-                    dest_zip.writestr(f.filename, buf, ZIP_DEFLATED)
-            src_zip.close()
+                    # Unchanged members keep their compressed data
+                    dest_zip.copyraw(src_zip, f)
+        finally:
             dest_zip.close()
-            shutil.copyfile(dest_file, self.file)
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            src_zip.close()
-            dest_zip.close()
-            shutil.rmtree(temp_dir)
-            raise Exception(repr(e))
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+            self.zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _get_zip(self):
+        # One archive handle and central directory parse per object, reopened after close()
+        if self.zip is None:
+            self.zip = ZipFile(self.file)
+        return self.zip
+
+    def _get_manifest(self):
+        if self._manifest is None:
+            self._manifest = _Manifest(self.tree)
+        return self._manifest
 
     def _get_file_content(self, filename):
-        zipfile = ZipFile(self.file)
-        content = zipfile.read(filename)
-        zipfile.close()
-        return content
+        return self._get_zip().read(filename)
 
     def _get_all(self, xpath_str):
-        return self.tree.xpath(xpath_str, namespaces=ns_map)
+        return _xpath(xpath_str)(self.tree)
 
     def _get(self, xpath_str):
-        node_list = self.tree.xpath(xpath_str, namespaces=ns_map)
+        node_list = self._get_all(xpath_str)
         for node in node_list:
             return node
 
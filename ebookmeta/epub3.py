@@ -1,8 +1,11 @@
 
 from .epub2 import Epub2
-from .utils import xstr
+from .utils import xstr, select_fields
 
 class Epub3(Epub2):
+    # '#id' -> <meta refines="#id"> elements of the OPF, built on first use and kept current by the setters
+    _refines = None
+
     ####### Getters (override) #######
     def get_title(self):
         node = self._get_title_node()
@@ -21,12 +24,35 @@ class Epub3(Epub2):
         for node in node_list: result.append(xstr(node.text))
         return result
 
+    def get_fields(self, fields=None):
+        values, titles, creators, refines = self._walk_metadata()
+        # The walk has seen every <meta refines>, so it provides the index for free
+        if self._refines is None:
+            self._refines = refines
+
+        if fields is None or 'title' in fields:
+            values['title'] = None
+            for node in titles:
+                title_types = self._get_node_refines(node, 'title-type')
+                if not title_types or any(e.text == 'main' for e in title_types):
+                    values['title'] = xstr(node.text)
+                    break
+        for role, key in (('aut', 'author_list'), ('trl', 'translator_list')):
+            if fields is None or key in fields:
+                values[key] = []
+                for node in creators:
+                    roles = self._get_node_refines(node, 'role')
+                    if (not roles and role == 'aut') or any(e.text == role for e in roles):
+                        values[key].append(xstr(node.text))
+        return select_fields(values, fields)
+
     def get_cover_data(self):
         media_type = None
         href = None
         data = None
-        node = self._get('opf:manifest/opf:item[@properties="cover-image"]')
-        if node is not None:
+        node_list = self._get_manifest().by_property.get('cover-image')
+        if node_list:
+            node = node_list[0]
             if 'media-type' in node.attrib: media_type = node.attrib['media-type']
             if 'href'in node.attrib: href = node.attrib['href']
             if href: data = self._get_file_content(self.content_root + href)
@@ -54,11 +80,11 @@ class Epub3(Epub2):
 
     ####### Service methods #######
     def _set_person_list(self, person_list, role):
+        refines = self._get_refines()
         node_list = self._get_person_node_list(role)
         for node in node_list:
             if 'id' in node.attrib:
-                refine_list = self._get_all('opf:metadata/opf:meta[@refines="#{0}"]'.format(node.attrib['id']))
-                for refine in refine_list: refine.getparent().remove(refine)
+                for refine in refines.pop('#' + node.attrib['id'], ()): refine.getparent().remove(refine)
             node.getparent().remove(node)
 
         meta_node = self._get('opf:metadata')
@@ -75,13 +101,14 @@ class Epub3(Epub2):
                 refine.attrib['property'] = 'role'
                 refine.text = role
                 refine.tail = '\n'
+                refines.setdefault(refine.attrib['refines'], []).append(refine)
 
                 index += 1
 
     def _get_title_node(self):
         node_list = self._get_all('opf:metadata/dc:title')
         for node in node_list:
-            refines_list = self._get_all('opf:metadata/opf:meta[@refines="#{0}" and @property="title-type"]'.format(self._get_element_id(node)))
+            refines_list = self._get_node_refines(node, 'title-type')
             if len(refines_list) == 0:
                 return node
             else:
@@ -93,7 +120,7 @@ class Epub3(Epub2):
         result_list = []
         node_list = self._get_all('opf:metadata/dc:creator')
         for node in node_list:
-            refines_list = self._get_all('opf:metadata/opf:meta[@refines="#{0}" and @property="role"]'.format(self._get_element_id(node)))
+            refines_list = self._get_node_refines(node, 'role')
             if len(refines_list) == 0 and role == 'aut':
                 result_list.append(node)
             else:
@@ -105,10 +132,21 @@ class Epub3(Epub2):
         return result_list
 
     def _get_element_refines(self, id, property):
-        value = self._get('opf:metadata/opf:meta[@refines="#{0}" and @property="{1}"]'.format(id, property))
-        if value is not None:
-            return xstr(value.text)
+        for value in self._get_refines().get('#' + id, ()):
+            if value.get('property') == property:
+                return xstr(value.text)
         return ''
 
+    def _get_refines(self):
+        if self._refines is None:
+            self._refines = {}
+            for node in self._get_all('opf:metadata/opf:meta[@refines]'):
+                self._refines.setdefault(node.attrib['refines'], []).append(node)
+        return self._refines
+
+    def _get_node_refines(self, node, property):
+        return [e for e in self._get_refines().get('#' + self._get_element_id(node), ())
+                if e.get('property') == property]
+
     def _get_element_id(self, e):
         return e.attrib['id'] if 'id' in e.attrib else ''
\ No newline at end of file
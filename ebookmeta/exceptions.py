@@ -31,3 +31,7 @@ class UnknownFormatException(Error):
 
 class BadEpubVersionException(Error):
     pass
+
+
+class UnknownFieldException(Error):
+    pass
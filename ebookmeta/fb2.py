@@ -1,22 +1,111 @@
 from lxml import etree
+import re
 import base64
+import copy
+import functools
 from io import BytesIO
+from contextlib import contextmanager
 
-from .utils import xstr
+from .utils import xstr, first_text, select_fields, replace_file, same_file
 from .myzipfile import ZipFile, is_zipfile
 
+READ_CHUNK_SIZE = 64 * 1024
+
+_DESCRIPTION_TAG = re.compile(rb'<(/?)(?:[\w.-]+:)?description(?=[\s/>])')
+# Start tag of a <binary> element, group 3 is '/' for an empty one
+_BINARY_START = re.compile(rb'<((?:[\w.-]+:)?binary)(\s[^>]*?)(/?)>')
+_ID_ATTRIBUTE = re.compile(rb'\sid\s*=\s*(["\'])(.*?)\1')
+_NS_DECLARATION = re.compile(rb'\sxmlns(?::([\w.-]+))?\s*=\s*(["\'])(.*?)\2')
+_XML_ENCODING = re.compile(rb'(?:\xef\xbb\xbf)?<\?xml[^>]*?encoding\s*=\s*["\']([\w.-]+)')
+
 ns_map = {
     'fb': 'http://www.gribuser.ru/xml/fictionbook/2.0',
     'l': 'http://www.w3.org/1999/xlink'
 }
 
 
+@functools.lru_cache(maxsize=None)
+def _xpath(xpath_str, namespaces):
+    # Compiled once per expression and namespace set, shared by all books
+    return etree.XPath(xpath_str, namespaces=dict(namespaces))
+
+
+_FIELD_TAGS = ('description', 'title-info', 'document-info', 'publish-info', 'book-title', 'author',
+               'translator', 'first-name', 'middle-name', 'last-name', 'sequence', 'lang', 'genre',
+               'annotation', 'id', 'book-name', 'publisher', 'year', 'city', 'isbn')
+
+
+@functools.lru_cache(maxsize=None)
+def _tag_names(ns):
+    # Clark names of the <description> elements mapped to their local names, so walking
+    # the header is a dict lookup per element
+    return {'{%s}%s' % (ns, name): name for name in _FIELD_TAGS}
+
+
+def _copy_bytes(src, dest, size=None):
+    # Copy size bytes (all that is left if None) from src to dest, or skip them if dest is None
+    while size is None or size > 0:
+        data = src.read(READ_CHUNK_SIZE if size is None else min(size, READ_CHUNK_SIZE))
+        if not data:
+            break
+        if dest is not None:
+            dest.write(data)
+        if size is not None:
+            size -= len(data)
+
+
+def _first(values, key, value):
+    # Keep the first value found, as taking the first node of an XPath result does
+    if key not in values and value is not None:
+        values[key] = value
+
+
+class _BinaryTarget():
+    # Parser target that decodes a single <binary> element and ignores everything else
+    def __init__(self, binary_id, sink):
+        self.binary_id = binary_id
+        self.sink = sink
+        self.media_type = None
+        self.found = False
+        self.done = False
+        self._pending = ''
+
+    def start(self, tag, attrib):
+        if not self.found and tag.rpartition('}')[2] == 'binary' and attrib.get('id') == self.binary_id:
+            self.found = True
+            self.media_type = attrib.get('content-type')
+
+    def data(self, data):
+        if self.found and not self.done:
+            self._pending += ''.join(data.split())
+            size = len(self._pending) - len(self._pending) % 4
+            if size:
+                self.sink.write(base64.b64decode(self._pending[:size]))
+                self._pending = self._pending[size:]
+
+    def end(self, tag):
+        if self.found and not self.done:
+            self.done = True
+            if self._pending:
+                self.sink.write(base64.b64decode(self._pending))
+
+    def close(self):
+        pass
+
+
 class Fb2():
     def __init__(self, file):
         self.file = file
         self.tree = None
+        self.header = None
         self.encoding = None
         self.zip_file_info = None
+        self._anchors = {}
+        self._binaries = None
+        # Byte range of <description> in the book, set when save() can splice the header in
+        self._description_range = None
+        self._spliced_range = None
+        self._binary_changes = {}
 
         self.ns_map = {}
 
@@ -26,19 +115,17 @@ class Fb2():
                 if info.filename.lower().endswith('.fb2'):
                     self.zip_file_info = info
                     break
-            
+            zipfile.close()
+
             if self.zip_file_info:
-                content = zipfile.read(self.zip_file_info)
-                self.tree = etree.parse(BytesIO(content), parser=etree.XMLParser(recover=True, remove_blank_text=True))
-                self.encoding = self.tree.docinfo.encoding
-                zipfile.close()
+                with self._open() as stream:
+                    self.header = self._parse_header(stream)
         else:
-            self.tree = etree.parse(self.file, parser=etree.XMLParser(recover=True, remove_blank_text=True))
-            self.encoding = self.tree.docinfo.encoding
-
+            with self._open() as stream:
+                self.header = self._parse_header(stream)
 
-        if self.tree is not None:
-            root = self.tree.getroot()
+        if self.header is not None:
+            root = self.header.getroot()
             for k, v in root.nsmap.items():
                 if k is None:
                     self.ns_map['fb'] = v
@@ -49,6 +136,7 @@ class Fb2():
                 self.ns_map['fb'] = ns_map['fb']
             if not 'l' in self.ns_map.keys():
                 self.ns_map['l'] = ns_map['l']
+        self._ns_key = tuple(sorted(self.ns_map.items()))
 
 
     ######## Getters ########
@@ -101,7 +189,7 @@ class Fb2():
     def get_identifier(self):
         return xstr(self._get('//fb:description/fb:document-info/fb:id/text()'))
 
-    def get_cover_data(self):
+    def get_cover_data(self, sink=None):
         media_type = None
         href = None
         data = None
@@ -109,16 +197,26 @@ class Fb2():
         href = self._get('//fb:description/fb:title-info/fb:coverpage/fb:image/@l:href')
         if href:
             href = href[1:] # Crop # symbol
-            node = self._get('//fb:binary[@id="{0}"]'.format(href))
-            if node is not None:
-                if 'content-type' in node.attrib:
-                    media_type = node.attrib['content-type']
-                else:
+            output = sink if sink is not None else BytesIO()
+            if self.tree is None:
+                target = self._stream_binary(href, output)
+                found, media_type = target.found, target.media_type
+            else:
+                found = False
+            if not found:
+                self._load_tree()
+                node = self._get_binary(href)
+                if node is not None:
+                    found = True
+                    media_type = node.attrib.get('content-type')
+                    output.write(base64.b64decode(node.text.encode('ascii')))
+            if found:
+                if not media_type:
                     if href.lower().endswith(('.jpeg', '.jpg')):
                         media_type = 'image/jpeg'
                     elif href.lower().endswith('.png'):
                         media_type = 'image/png'
-                data = base64.b64decode(node.text.encode('ascii'))
+                data = sink if sink is not None else output.getvalue()
         return (href, media_type, data)
 
     def get_publish_title(self):
@@ -143,39 +241,111 @@ class Fb2():
         return xstr(self._get('//fb:description/fb:publish-info/fb:sequence/@number'))
     
 
+    def get_fields(self, fields=None):
+        # One pass over title-info, document-info and publish-info gives every field the single getters return.
+        # With fields given only those are returned, and person names and the annotation text are built only if asked for
+        names = _tag_names(self.ns_map['fb'])
+        authors = fields is None or 'author_list' in fields
+        translators = fields is None or 'translator_list' in fields
+        annotation = fields is None or 'description' in fields
+        tree = self.tree if self.tree is not None and self._description_range is None else self.header
+        values = {}
+        publish = {}
+        author_list = []
+        translator_list = []
+        tag_list = []
+        for description in tree.getroot():
+            if names.get(description.tag) != 'description':
+                continue
+            for info in description:
+                info_name = names.get(info.tag)
+                if info_name == 'title-info':
+                    for e in info:
+                        name = names.get(e.tag)
+                        if name == 'author':
+                            if authors:
+                                author_list.append(self._get_person(e))
+                        elif name == 'translator':
+                            if translators:
+                                translator_list.append(self._get_person(e))
+                        elif name == 'genre':
+                            tag_list.append(xstr(e.text))
+                        elif name == 'sequence':
+                            _first(values, 'series', e.get('name'))
+                            _first(values, 'series_index', e.get('number'))
+                        elif name == 'annotation':
+                            if annotation and 'description' not in values:
+                                values['description'] = ''.join(e.itertext())
+                        elif name in ('book-title', 'lang'):
+                            _first(values, name, first_text(e))
+                elif info_name == 'document-info':
+                    for e in info:
+                        if names.get(e.tag) == 'id':
+                            _first(values, 'identifier', first_text(e))
+                elif info_name == 'publish-info':
+                    for e in info:
+                        name = names.get(e.tag)
+                        if name == 'sequence':
+                            _first(publish, 'series', e.get('name'))
+                            _first(publish, 'series_index', e.get('number'))
+                        elif name in ('book-name', 'publisher', 'year', 'city', 'isbn'):
+                            _first(publish, name, first_text(e))
+
+        result = {
+            'identifier': xstr(values.get('identifier')),
+            'title': xstr(values.get('book-title')),
+            'author_list': author_list,
+            'series': xstr(values.get('series')),
+            'series_index': xstr(values.get('series_index')),
+            'lang': xstr(values.get('lang')),
+            'description': values.get('description'),
+            'tag_list': tag_list,
+            'translator_list': translator_list,
+            'publish_info': {
+                'title': xstr(publish.get('book-name')),
+                'publisher': xstr(publish.get('publisher')),
+                'year': xstr(publish.get('year')),
+                'city': xstr(publish.get('city')),
+                'series': xstr(publish.get('series')),
+                'series_index': xstr(publish.get('series_index')),
+                'isbn': xstr(publish.get('isbn')),
+            },
+        }
+        return select_fields(result, fields)
+
     ######## Setters ########
     def set_title(self, title):
-        node = self._get('//fb:description/fb:title-info/fb:book-title')
+        parent = self._get_anchor('title-info')
+        node = self._get_child(parent, 'fb:book-title')
         if node is None:
-            parent = self._get('//fb:description/fb:title-info')
             node = self._sub_element(parent, 'fb:book-title')
         node.text = title
 
     def set_author_list(self, author_list):
-        node_list = self._get_all('//fb:description/fb:title-info/fb:author')
-        for node in node_list: node.getparent().remove(node)
-        parent = self._get('//fb:description/fb:title-info')
+        parent = self._get_anchor('title-info')
+        node_list = self._get_children(parent, 'fb:author')
+        for node in node_list: parent.remove(node)
         for author in author_list:
             if author:
                 node = self._sub_element(parent, 'fb:author')
                 self._set_person(node, author)
        
     def set_series(self, series):
-        node = self._get('//fb:description/fb:title-info/fb:sequence')
+        parent = self._get_anchor('title-info')
+        node = self._get_child(parent, 'fb:sequence')
         if series:
             if node is None:
-                parent = self._get('//fb:description/fb:title-info')
                 node = self._sub_element(parent, 'fb:sequence')
             node.attrib['name'] = series
         else:
             if node is not None:
-                node.getparent().remove(node)
+                parent.remove(node)
 
     def set_series_index(self, series_index):
-        node = self._get('//fb:description/fb:title-info/fb:sequence')
+        parent = self._get_anchor('title-info')
+        node = self._get_child(parent, 'fb:sequence')
         if series_index:
             if node is None:
-                parent = self._get('//fb:description/fb:title-info')
                 node = self._sub_element(parent, 'fb:sequence')
             node.attrib['number'] = str(series_index)
         else:
@@ -184,173 +354,419 @@ class Fb2():
 
 
     def set_lang(self, lang):
-        node = self._get('//fb:description/fb:title-info/fb:lang')
+        parent = self._get_anchor('title-info')
+        node = self._get_child(parent, 'fb:lang')
         if node is None:
-            parent = self._get('//fb:description/fb:title-info')
             node = self._sub_element(parent, 'fb:lang')
         node.text = lang
 
     def set_tag_list(self, tag_list):
-        node_list = self._get_all('//fb:description/fb:title-info/fb:genre')
-        for node in node_list: node.getparent().remove(node)
-        parent = self._get('//fb:description/fb:title-info')
+        parent = self._get_anchor('title-info')
+        node_list = self._get_children(parent, 'fb:genre')
+        for node in node_list: parent.remove(node)
         for tag in tag_list:
             if tag:
                 node = self._sub_element(parent, 'fb:genre')
                 node.text = tag
 
     def set_translator_list(self, translator_list):
-        node_list = self._get_all('//fb:description/fb:title-info/fb:translator')
-        for node in node_list: node.getparent().remove(node)
-        parent = self._get('//fb:description/fb:title-info')
+        parent = self._get_anchor('title-info')
+        node_list = self._get_children(parent, 'fb:translator')
+        for node in node_list: parent.remove(node)
         for translator in translator_list:
             if translator:
                 node = self._sub_element(parent, 'fb:translator')
                 self._set_person(node, translator)
 
     def set_cover_data(self, href, media_type, data):
-        old_href = self._get('//fb:description/fb:title-info/fb:coverpage/fb:image/@l:href')
+        parent = self._get_anchor('title-info')
+        old_href = self._get_child(parent, 'fb:coverpage/fb:image/@l:href')
         if old_href:
             href = old_href[1:] # Crop # symbol
         else:
-            parent = self._get('//fb:description/fb:title-info')
             node = self._sub_element(parent, 'fb:coverpage')
             image_node = self._sub_element(node, 'fb:image')
             image_node.attrib[etree.QName('http://www.w3.org/1999/xlink', 'href')] = '#{}'.format(href)
 
-        node = self._get('//fb:binary[@id="{0}"]'.format(href))
-        if node is None and href:
-            node = self._sub_element(self.tree.getroot(), 'fb:binary')
-            node.attrib['id'] = href
-            node.attrib['content-type'] = media_type
-        
-        if data:
-            node.text = base64.encodebytes(data)
-        else:
-            # Delete old cover image
-            if node is not None:
+        if self._description_range is not None:
+            # The <binary> is outside the header, save() splices it into the original bytes
+            if href:
+                self._binary_changes[href] = (media_type, data)
+        elif href:
+            node = self._get_binary(href)
+            if node is None:
+                node = self._sub_element(self.tree.getroot(), 'fb:binary')
+                node.attrib['id'] = href
+                node.attrib['content-type'] = media_type
+                self._binaries[href] = node
+
+            if data:
+                node.text = base64.encodebytes(data)
+            elif node is not None:
+                # Delete old cover image
                 node.getparent().remove(node)
+                self._binaries.pop(href, None)
 
-            node = self._get('//fb:description/fb:title-info/fb:coverpage')
+        if not data:
+            node = self._get_child(parent, 'fb:coverpage')
             if node is not None:
-                 node.getparent().remove(node)
+                 parent.remove(node)
 
     def set_publish_title(self, title):
-        node = self._get('//fb:description/fb:publish-info/fb:book-name')
-        if node is None:
-            parent = self._get('//fb:description/fb:publish-info')
-            if parent is None:
-                descr_node = self._get('//fb:description')
-                parent = self._sub_element(descr_node, 'fb:publish-info')
-            node = self._sub_element(parent, 'fb:book-name')
-        if title:
-            node.text = title
-        else:
-            node.getparent().remove(node)
+        self._set_publish_text('fb:book-name', title)
 
     def set_publish_publisher(self, publisher):
-        node = self._get('//fb:description/fb:publish-info/fb:publisher')
-        if node is None:
-            parent = self._get('//fb:description/fb:publish-info')
-            if parent is None:
-                descr_node = self._get('//fb:description')
-                parent = self._sub_element(descr_node, 'fb:publish-info')
-            node = self._sub_element(parent, 'fb:publisher')
-        if publisher:
-            node.text = publisher
-        else:
-            node.getparent().remove(node)
+        self._set_publish_text('fb:publisher', publisher)
 
     def set_publish_year(self, year):
-        node = self._get('//fb:description/fb:publish-info/fb:year')
-        if node is None:
-            parent = self._get('//fb:description/fb:publish-info')
-            if parent is None:
-                descr_node = self._get('//fb:description')
-                parent = self._sub_element(descr_node, 'fb:publish-info')
-            node = self._sub_element(parent, 'fb:year')
-        if year:
-            node.text = year
-        else:
-           node.getparent().remove(node) 
+        self._set_publish_text('fb:year', year)
 
     def set_publish_city(self, city):
-        node = self._get('//fb:description/fb:publish-info/fb:city')
-        if node is None:
-            parent = self._get('//fb:description/fb:publish-info')
-            if parent is None:
-                descr_node = self._get('//fb:description')
-                parent = self._sub_element(descr_node, 'fb:publish-info')
-            node = self._sub_element(parent, 'fb:city')
-        if city:
-            node.text = city
-        else:
-            node.getparent().remove(node)
+        self._set_publish_text('fb:city', city)
 
     def set_publish_isbn(self, isbn):
-        node = self._get('//fb:description/fb:publish-info/fb:isbn')
-        if node is None:
-            parent = self._get('//fb:description/fb:publish-info')
-            if parent is None:
-                descr_node = self._get('//fb:description')
-                parent = self._sub_element(descr_node, 'fb:publish-info')
-            node = self._sub_element(parent, 'fb:isbn')
-        if isbn:
-            node.text = isbn
-        else:
-           node.getparent().remove(node) 
+        self._set_publish_text('fb:isbn', isbn)
 
     def set_publish_series(self, series):
-        node = self._get('//fb:description/fb:publish-info/fb:sequence')
+        parent = self._get_anchor('publish-info')
+        node = self._get_child(parent, 'fb:sequence') if parent is not None else None
         if series:
             if node is None:
-                parent = self._get('//fb:description/fb:publish-info')
-                if parent is None:
-                    descr_node = self._get('//fb:description')
-                    parent = self._sub_element(descr_node, 'fb:publish-info')
+                parent = self._get_publish_info()
                 node = self._sub_element(parent, 'fb:sequence')
             node.attrib['name'] = series
         else:
             if node is not None:
-                node.getparent().remove(node)
+                parent.remove(node)
 
     def set_publish_series_index(self, series_index):
-        node = self._get('//fb:description/fb:publish-info/fb:sequence')
+        parent = self._get_anchor('publish-info')
+        node = self._get_child(parent, 'fb:sequence') if parent is not None else None
         if series_index:
             if node is None:
-                parent = self._get('//fb:description/fb:publish-info')
-                if parent is None:
-                    descr_node = self._get('//fb:description')
-                    parent = self._sub_element(descr_node, 'fb:publish-info')
+                parent = self._get_publish_info()
                 node = self._sub_element(parent, 'fb:sequence')
             node.attrib['number'] = str(series_index)
         else:
             if node is not None and 'number' in node.attrib:
                 node.attrib.pop('number')
 
+    def _set_publish_text(self, name, value):
+        parent = self._get_publish_info()
+        node = self._get_child(parent, name)
+        if node is None:
+            node = self._sub_element(parent, name)
+        if value:
+            node.text = value
+        else:
+            parent.remove(node)
+
     ######## Service methods ########
-    def save(self):
-        if is_zipfile(self.file):
-            zipfile = ZipFile(self.file, mode='w')
-            zipfile.writestr(self.zip_file_info,
-                       etree.tostring(self.tree.getroot(), encoding=self.encoding,
-                                      method='xml', xml_declaration=True, pretty_print=True))
-            zipfile.close()
+    def save(self, output=None):
+        if self._description_range is None:
+            self._load_tree()
+        if output is None and not isinstance(self.file, str):
+            output = BytesIO()
+            self._write(output)
+            return output.getvalue()
+        if output is None or same_file(self.file, output):
+            replace_file(self.file, self._write)
+            if self._description_range is not None:
+                # The file now holds the new description
+                self._description_range = self._spliced_range
+                self._binary_changes = {}
         else:
-            self.tree.write(self.file, encoding=self.encoding, method='xml', 
+            self._write(output)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _write(self, output):
+        if self.zip_file_info:
+            # Other members of the archive are copied as they are, the book is written
+            # straight into the compressor
+            with ZipFile(self.file) as src_zip, ZipFile(output, mode='w') as dest_zip:
+                for info in src_zip.infolist():
+                    if info.filename == self.zip_file_info.filename:
+                        with dest_zip.open(copy.copy(info), mode='w') as dest:
+                            self._write_document(dest)
+                    else:
+                        dest_zip.copyraw(src_zip, info)
+        elif isinstance(output, str):
+            with open(output, 'wb') as dest:
+                self._write_document(dest)
+        else:
+            self._write_document(output)
+
+    def _write_document(self, dest):
+        if self._description_range is not None:
+            self._write_spliced(dest)
+        else:
+            self.tree.write(dest, encoding=self.encoding, method='xml',
                             xml_declaration=True, pretty_print=True)
 
+    def _write_spliced(self, dest):
+        # Only <description> and changed <binary> elements are serialized, everything else
+        # is copied from the original bytes
+        start, end = self._description_range
+        encoding = self._get_header_encoding()
+        description = self._serialize(self._get_anchor('description'), encoding)
+        with self._open() as stream:
+            _copy_bytes(stream, dest, start)
+            _copy_bytes(stream, None, end - start)
+            dest.write(description)
+            if self._binary_changes:
+                self._splice_binaries(stream, dest, encoding)
+            else:
+                _copy_bytes(stream, dest)
+        self._spliced_range = (start, start + len(description))
+
+    def _splice_binaries(self, stream, dest, encoding):
+        # Copy the rest of the file, replacing or dropping the changed <binary> elements on the way.
+        # Only a chunk and the bytes of a tag cut at its end are held in memory.
+        changes = dict(self._binary_changes)
+        chunks = iter(lambda: stream.read(READ_CHUNK_SIZE), b'')
+        buf = next(chunks, b'')
+        while True:
+            m = _BINARY_START.search(buf)
+            if m is None:
+                chunk = next(chunks, b'')
+                if not chunk:
+                    break
+                # Keep the last end tag, the root one may be there, and a start tag cut at the end
+                keep = buf.rfind(b'</')
+                if keep < 0:
+                    keep = buf.rfind(b'<')
+                if keep < 0:
+                    keep = len(buf)
+                dest.write(buf[:keep])
+                buf = buf[keep:] + chunk
+                continue
+
+            dest.write(buf[:m.start()])
+            buf = buf[m.end():]
+            id = _ID_ATTRIBUTE.search(m.group(2))
+            id = id.group(2).decode(encoding) if id else None
+            changed = id in changes
+            binary = changes.pop(id)[1] if changed else None
+            if m.group(3):
+                # An empty element, <binary .../>
+                if not changed:
+                    dest.write(m.group(0))
+                elif binary:
+                    dest.write(m.group(0)[:m.end(2) - m.start()].rstrip() + b'>' + base64.encodebytes(binary)
+                               + b'</' + m.group(1) + b'>')
+                continue
+
+            if not changed:
+                dest.write(m.group(0))
+            elif binary:
+                dest.write(m.group(0) + base64.encodebytes(binary))
+            end_tag = re.compile(rb'</' + re.escape(m.group(1)) + rb'\s*>')
+            while True:
+                e = end_tag.search(buf)
+                if e is not None:
+                    if not changed:
+                        dest.write(buf[:e.end()])
+                    elif binary:
+                        dest.write(e.group(0))
+                    buf = buf[e.end():]
+                    break
+                chunk = next(chunks, b'')
+                if not chunk:
+                    break
+                # The content is passed through chunk by chunk, an end tag cut at the end is kept
+                keep = buf.rfind(b'<')
+                if keep < 0:
+                    keep = len(buf)
+                if not changed:
+                    dest.write(buf[:keep])
+                buf = buf[keep:] + chunk
+
+        # New binaries go right before the end tag of the root element
+        new = b''
+        for id, (media_type, binary) in changes.items():
+            if binary:
+                node = etree.Element(etree.QName(self.ns_map['fb'], 'binary'), nsmap=self.header.getroot().nsmap)
+                node.attrib['id'] = id
+                node.attrib['content-type'] = media_type
+                node.text = base64.encodebytes(binary)
+                new += self._serialize(node, encoding) + b'\n'
+        if new:
+            pos = buf.rfind(b'</')
+            buf = buf[:pos] + new + buf[pos:]
+        dest.write(buf)
+
+    def _serialize(self, node, encoding):
+        data = etree.tostring(node, encoding=encoding, method='xml', xml_declaration=False,
+                              pretty_print=True, with_tail=False).rstrip(b'\n')
+        # Namespaces declared by the root element are not repeated on the spliced one
+        root_nsmap = self.header.getroot().nsmap
+        def strip(m):
+            prefix = m.group(1).decode('ascii') if m.group(1) else None
+            return b'' if root_nsmap.get(prefix) == m.group(3).decode(encoding) else m.group(0)
+        end = data.index(b'>')
+        return _NS_DECLARATION.sub(strip, data[:end]) + data[end:]
+
+    def _get_header_encoding(self):
+        with self._open() as stream:
+            m = _XML_ENCODING.match(stream.read(200))
+        return m.group(1).decode('ascii') if m else 'utf-8'
+
+    @contextmanager
+    def _open(self):
+        if self.zip_file_info:
+            zipfile = ZipFile(self.file)
+            stream = zipfile.open(self.zip_file_info.filename)
+            zipfile.close()
+            with stream:
+                yield stream
+        elif isinstance(self.file, str):
+            with open(self.file, 'rb') as stream:
+                yield stream
+        else:
+            # Caller's stream, it is rewound but not closed
+            self.file.seek(0)
+            yield self.file
+
+    def _parse_header(self, stream):
+        # Build only the <description> subtree and stop reading there. The byte range of the
+        # element is kept, so save() can replace it and copy the rest of the file as is.
+        parser = etree.XMLPullParser(events=('start', 'end'), tag='{*}description',
+                                     recover=True, remove_blank_text=True)
+        bounds = {}
+        fed = 0
+        buf = b''
+
+        def feed(data, at_tag_end):
+            parser.feed(data)
+            for event, element in parser.read_events():
+                if event == 'start':
+                    bounds['start'] = bounds.get('tag_start')
+                else:
+                    # The range holds only if the element ended at the matched end tag. An unclosed
+                    # tag in the header makes the recovering parser end it later, with the body
+                    # taken in, and such a book is saved from the full tree.
+                    if at_tag_end and bounds.get('start') is not None:
+                        self._description_range = (bounds['start'], bounds['tag_end'])
+                    return element.getroottree()
+
+        while True:
+            chunk = stream.read(READ_CHUNK_SIZE)
+            buf += chunk
+            # A tag cut at the end of the chunk is completed by the next one
+            limit = len(buf) - 64 if chunk else len(buf)
+            pos = 0
+            for m in _DESCRIPTION_TAG.finditer(buf):
+                closing = bool(m.group(1))
+                # Feed up to the start of an opening tag and through the end of a closing one,
+                # so the body is never parsed and the element bounds are known
+                cut = buf.find(b'>', m.end()) + 1 if closing else m.start()
+                if m.start() >= limit or (closing and not cut):
+                    limit = m.start()
+                    break
+                fed += cut - pos
+                if closing:
+                    bounds['tag_end'] = fed
+                tree = feed(buf[pos:cut], closing)
+                if tree is not None:
+                    return tree
+                pos = cut
+                if not closing:
+                    bounds['tag_start'] = fed
+            if limit > pos:
+                fed += limit - pos
+                tree = feed(buf[pos:limit], False)
+                if tree is not None:
+                    return tree
+                pos = limit
+            buf = buf[pos:]
+            if not chunk:
+                break
+        return etree.ElementTree(parser.close())
+
+    def _stream_binary(self, binary_id, sink):
+        # The body is skipped on the byte level: parsing starts at the first <binary> tag
+        target = _BinaryTarget(binary_id, sink)
+        parser = etree.XMLParser(target=target, recover=True, huge_tree=True)
+        started = False
+        tail = b''
+        with self._open() as stream:
+            for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b''):
+                if not started:
+                    chunk = tail + chunk
+                    pos = chunk.find(b'<binary')
+                    if pos < 0:
+                        tail = chunk[-len(b'<binary'):]
+                        continue
+                    chunk = b'<binaries>' + chunk[pos:]
+                    started = True
+                parser.feed(chunk)
+                if target.done:
+                    break
+        return target
+
+    def _load_tree(self):
+        if self.tree is None:
+            with self._open() as stream:
+                self.tree = etree.parse(stream, parser=etree.XMLParser(recover=True, remove_blank_text=True))
+            self.encoding = self.tree.docinfo.encoding
+
+    def _get_anchor(self, name):
+        # description, title-info and publish-info of the loaded tree, found once by child navigation
+        if name not in self._anchors:
+            if name == 'description':
+                node = self._get_child(self._get_edit_root(), 'fb:description')
+            else:
+                parent = self._get_anchor('description')
+                node = self._get_child(parent, 'fb:' + name) if parent is not None else None
+            self._anchors[name] = node
+        return self._anchors[name]
+
+    def _get_edit_root(self):
+        # Setters change the header tree when save() can splice it into the original bytes,
+        # otherwise the whole document is loaded
+        if self._description_range is not None:
+            return self.header.getroot()
+        self._load_tree()
+        return self.tree.getroot()
+
+    def _get_publish_info(self):
+        node = self._get_anchor('publish-info')
+        if node is None:
+            node = self._sub_element(self._get_anchor('description'), 'fb:publish-info')
+            self._anchors['publish-info'] = node
+        return node
+
+    def _get_binary(self, binary_id):
+        # <binary> elements are children of the root, map them by id instead of searching the body
+        if self._binaries is None:
+            self._binaries = {}
+            for node in self._get_children(self.tree.getroot(), 'fb:binary'):
+                # A binary without an id can't be referenced, it must not be taken for a missing cover
+                if node.get('id') is not None:
+                    self._binaries.setdefault(node.get('id'), node)
+        return self._binaries.get(binary_id)
+
     def _get_person(self, node):
         first_name = ''
         middle_name = ''
         last_name = ''
 
+        names = _tag_names(self.ns_map['fb'])
         for e in node:
-            if etree.QName(e).localname == 'first-name':
+            name = names.get(e.tag)
+            if name == 'first-name':
                 first_name = xstr(e.text)
-            elif etree.QName(e).localname == 'middle-name':
+            elif name == 'middle-name':
                 middle_name = xstr(e.text)
-            elif etree.QName(e).localname == 'last-name':
+            elif name == 'last-name':
                 last_name = xstr(e.text)
 
         author = '{0} {1} {2}'.format(first_name, middle_name, last_name)
@@ -382,12 +798,24 @@ class Fb2():
 
 
     def _get(self, xpath):
-        node_list = self.tree.xpath(xpath, namespaces=self.ns_map)
+        node_list = self._get_all(xpath)
         for node in node_list:
             return node
 
     def _get_all(self, xpath):
-        return self.tree.xpath(xpath, namespaces=self.ns_map)
+        if self.tree is not None and self._description_range is None:
+            tree = self.tree
+        else:
+            tree = self.header
+        return _xpath(xpath, self._ns_key)(tree)
+
+    def _get_child(self, parent, xpath):
+        for node in self._get_children(parent, xpath):
+            return node
+
+    def _get_children(self, parent, xpath):
+        # Relative to an anchor element, so only its children are looked at
+        return _xpath(xpath, self._ns_key)(parent)
 
     def _sub_element(self, parent, name):
         ns, tag = name.split(':')
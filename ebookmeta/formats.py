@@ -0,0 +1,184 @@
+import copy
+from io import BytesIO
+from lxml import etree
+
+from .exceptions import UnknownFormatException
+from .myzipfile import ZipFile, BadZipFile
+from .utils import replace_file, same_file
+
+SNIFF_SIZE = 4096
+
+_ZIP_MAGIC = b'PK\x03\x04'
+_EPUB_MIMETYPE = b'mimetypeapplication/epub+zip'
+
+
+class _Probe():
+    # The first bytes of a file and, for zip archives, the member names read on demand
+    def __init__(self, file):
+        self.file = file
+        self._names = None
+        if isinstance(file, str):
+            with open(file, 'rb') as f:
+                self.head = f.read(SNIFF_SIZE)
+        else:
+            file.seek(0)
+            self.head = file.read(SNIFF_SIZE)
+
+    @property
+    def is_zip(self):
+        return self.head.startswith(_ZIP_MAGIC)
+
+    def root_tag(self):
+        # Local name of the document element, the file is parsed only up to its start tag
+        parser = etree.XMLPullParser(events=('start',), resolve_entities=False)
+        try:
+            for chunk in self._chunks():
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    return etree.QName(element).localname
+        except etree.XMLSyntaxError:
+            pass
+        return None
+
+    def _chunks(self):
+        yield self.head
+        if isinstance(self.file, str):
+            with open(self.file, 'rb') as f:
+                f.seek(len(self.head))
+                yield from iter(lambda: f.read(SNIFF_SIZE), b'')
+        else:
+            self.file.seek(len(self.head))
+            yield from iter(lambda: self.file.read(SNIFF_SIZE), b'')
+
+    @property
+    def names(self):
+        if self._names is None:
+            try:
+                with ZipFile(self.file) as zipfile:
+                    self._names = [info.filename for info in zipfile.infolist()]
+            except BadZipFile:
+                self._names = []
+        return self._names
+
+
+def _is_epub(probe):
+    if not probe.is_zip:
+        return False
+    # The mimetype entry is stored first and uncompressed, its name and content follow the local header
+    return probe.head[30:58] == _EPUB_MIMETYPE or 'META-INF/container.xml' in probe.names
+
+
+def _is_fb2(probe):
+    if probe.is_zip:
+        return any(name.lower().endswith('.fb2') for name in probe.names)
+    head = probe.head
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        head = head.decode('utf-16', errors='ignore').encode('utf-8')
+    if b'<FictionBook' in head or b':FictionBook' in head:
+        return True
+    # A long prolog (comments, a DOCTYPE) can push the root element past the sniffed bytes
+    return len(probe.head) == SNIFF_SIZE and probe.root_tag() == 'FictionBook'
+
+
+def _is_zipped_epub(probe):
+    return probe.is_zip and any(name.lower().endswith('.epub') for name in probe.names)
+
+
+def _open_fb2(file):
+    from .fb2 import Fb2
+    return Fb2(file)
+
+
+def _open_epub(file):
+    from .epub2 import Epub2
+    from .epub3 import Epub3
+
+    ebook = Epub2(file)
+    if ebook.version[:1] == '3':
+        ebook = Epub3.from_epub(ebook)
+    return ebook
+
+
+def _open_zipped_epub(file):
+    with ZipFile(file) as zipfile:
+        for info in zipfile.infolist():
+            if info.filename.lower().endswith('.epub'):
+                return _ZippedEbook(file, info, _open_epub(BytesIO(zipfile.read(info))))
+
+
+class _ZippedEbook():
+    # A book stored as a member of a zip archive; everything but save() goes to the book itself
+    def __init__(self, file, info, ebook):
+        self.file = file
+        self.info = info
+        self.ebook = ebook
+
+    def __getattr__(self, name):
+        return getattr(self.ebook, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def patch(self):
+        # The book is a member of another archive, which has to be rebuilt anyway
+        return self.save()
+
+    def save(self, output=None):
+        data = self.ebook.save()
+        buf = BytesIO()
+        with ZipFile(self.file) as src_zip, ZipFile(buf, mode='w') as dest_zip:
+            for info in src_zip.infolist():
+                if info.filename == self.info.filename:
+                    dest_zip.writestr(copy.copy(info), data)
+                else:
+                    dest_zip.writestr(copy.copy(info), src_zip.read(info))
+
+        if output is None and not isinstance(self.file, str):
+            return buf.getvalue()
+        output = output if output is not None else self.file
+        if same_file(self.file, output):
+            replace_file(self.file, lambda f: f.write(buf.getvalue()))
+        elif isinstance(output, str):
+            with open(output, 'wb') as f:
+                f.write(buf.getvalue())
+        else:
+            output.write(buf.getvalue())
+
+
+# Checked in order, the first format whose sniffer matches wins
+_formats = [
+    ('epub', _is_epub, _open_epub),
+    ('fb2', _is_fb2, _open_fb2),
+    ('epub.zip', _is_zipped_epub, _open_zipped_epub),
+]
+
+
+def register_format(name, sniffer, opener):
+    _formats.insert(0, (name, sniffer, opener))
+
+
+def _find_format(file):
+    probe = _Probe(file)
+    for fmt in _formats:
+        if fmt[1](probe):
+            return fmt
+    return None
+
+
+def detect_format(file):
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        file = BytesIO(file)
+    fmt = _find_format(file)
+    return fmt[0] if fmt is not None else None
+
+
+def open_ebook(file):
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        file = BytesIO(file)
+    fmt = _find_format(file)
+    if fmt is None:
+        raise UnknownFormatException
+    return fmt[2](file)
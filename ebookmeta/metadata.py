@@ -5,6 +5,11 @@ from .fb2genres import fb2genres
 from .exceptions import BadLanguage
 from .utils import str_to_list, replace_keywords, split_ext, normalize_path
 
+_genre_title_xpath = etree.XPath('//fbgenrestransfer/genre/subgenres/subgenre[@value=$tag]/genre-descr[@lang=$lang]/@title')
+
+_COVER_ATTRIBUTES = {'cover_image_data': 'cover', 'cover_file_name': 'cover', 'cover_media_type': 'cover'}
+
+
 class PublishInfo:
     def __init__(self):
         self.title = None
@@ -36,13 +41,95 @@ class Metadata:
         self.lang = None
         self.format = None
         self.format_version = None
-        self.cover_image_data = None
-        self.cover_file_name = None
-        self.cover_media_type = None
+        self._cover_loader = None
+        self._cover_image_data = None
+        self._cover_file_name = None
+        self._cover_media_type = None
+        # The cover as loaded from the book, to tell whether it was changed since
+        self._cover_original = None
         self.file = None
         self.publish_info = PublishInfo()
         self.file_created = None
         self.file_modified = None
+        # Fields read from the book or assigned since, set_metadata() writes only these
+        # (and those changed in place); None means all of them
+        self._fields = None
+
+    def __setattr__(self, name, value):
+        fields = self.__dict__.get('_fields')
+        if fields is not None and not name.startswith('_'):
+            # A new set, the read one may be shared by many Metadata objects
+            self.__dict__['_fields'] = fields | {_COVER_ATTRIBUTES.get(name, name)}
+        super().__setattr__(name, value)
+
+    @property
+    def cover_image_data(self):
+        self._load_cover()
+        return self._cover_image_data
+
+    @cover_image_data.setter
+    def cover_image_data(self, value):
+        self._load_cover()
+        self._cover_image_data = value
+
+    @property
+    def cover_file_name(self):
+        self._load_cover()
+        return self._cover_file_name
+
+    @cover_file_name.setter
+    def cover_file_name(self, value):
+        self._load_cover()
+        self._cover_file_name = value
+
+    @property
+    def cover_media_type(self):
+        self._load_cover()
+        return self._cover_media_type
+
+    @cover_media_type.setter
+    def cover_media_type(self, value):
+        self._load_cover()
+        self._cover_media_type = value
+
+    def set_cover_loader(self, loader):
+        # loader() returns (file_name, media_type, image_data) and is called on first access
+        self._cover_loader = loader
+
+    def _load_cover(self):
+        if self._cover_loader is not None:
+            loader = self._cover_loader
+            self._cover_loader = None
+            (self._cover_file_name, self._cover_media_type, self._cover_image_data) = loader()
+            self._cover_original = (self._cover_file_name, self._cover_media_type, self._cover_image_data)
+
+    def _cover_changed(self):
+        # False while the cover is not loaded or still the one loaded from the book
+        if self._cover_loader is not None:
+            return False
+        return (self._cover_file_name, self._cover_media_type, self._cover_image_data) != self._cover_original
+
+    def _written_fields(self):
+        # Fields set_metadata() writes: the read and assigned ones, and those that differ from
+        # the defaults after a change in place, e.g. author_list.append()
+        if self._fields is None:
+            return None
+        default = Metadata()
+        fields = set(self._fields)
+        for name in ('identifier', 'title', 'author_list', 'translator_list', 'series', 'series_index',
+                     'tag_list', 'description', 'lang'):
+            if getattr(self, name) != getattr(default, name):
+                fields.add(name)
+        if vars(self.publish_info) != vars(default.publish_info):
+            fields.add('publish_info')
+        if self._cover_loader is not None or self._cover_image_data is not None:
+            fields.add('cover')
+        return fields
+
+    def __getstate__(self):
+        # The cover loader is bound to an open ebook and can't be pickled
+        self._load_cover()
+        return self.__dict__
 
     def author_list_to_string(self):
         return ', '.join(self.author_list) if self.author_list else []
@@ -58,9 +145,8 @@ class Metadata:
             raise BadLanguage('Only ru and en languages supports')
         result = []
         tree = etree.fromstring(fb2genres, parser=etree.XMLParser())
-        xpath_str = '//fbgenrestransfer/genre/subgenres/subgenre[@value="{}"]/genre-descr[@lang="{}"]/@title'
         for tag in self.tag_list:
-            node = tree.xpath(xpath_str.format(tag, lang))
+            node = _genre_title_xpath(tree, tag=tag, lang=lang)
             try:
                 result.append(str(node[0]))
             except IndexError:
@@ -176,13 +262,16 @@ class Metadata:
     def __str__(self):
         result = []
         for key in self.__dict__.keys():
+            if key in ('_cover_loader', '_cover_original', '_fields'):
+                continue
+            key = key.lstrip('_')
             if key == 'cover_image_data':
-                if self.__dict__[key] is not None:
+                if getattr(self, key) is not None:
                     result.append('{0}: {1}'.format(key, '<binary_data>')) 
                 else:
                     result.append('{0}: {1}'.format(key, 'None')) 
             else:
-                result.append('{0}: {1}'.format(key, self.__dict__[key]))
+                result.append('{0}: {1}'.format(key, getattr(self, key)))
 
         return '[' + ', '.join(result) + ']'
 
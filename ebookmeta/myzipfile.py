@@ -15,6 +15,7 @@ import stat
 import shutil
 import struct
 import binascii
+import copy
 
 try:
     import threading
@@ -166,6 +167,19 @@ _CD64_NUMBER_ENTRIES_TOTAL = 7
 _CD64_DIRECTORY_SIZE = 8
 _CD64_OFFSET_START_CENTDIR = 9
 
+def _strip_extra(extra, xids):
+    """Remove the extra field records with the given header ids."""
+    unpack = struct.unpack
+    buffer = []
+    i = 0
+    while i + 4 <= len(extra):
+        xid, xlen = unpack('<HH', extra[i:i + 4])
+        j = i + 4 + xlen
+        if xid not in xids:
+            buffer.append(extra[i:j])
+        i = j
+    return b''.join(buffer)
+
 def _check_zipfile(fp):
     try:
         if _EndRecData(fp):
@@ -1657,6 +1671,70 @@ class ZipFile:
             with self.open(zinfo, mode='w') as dest:
                 dest.write(data)
 
+    def copyraw(self, source, name):
+        """Copy the member 'name' of the ZipFile 'source' into the archive
+        as it is stored there. The compressed bytes, CRC and sizes are
+        taken over, the data is not decompressed and compressed again.
+        'name' is either the name of the member or its ZipInfo. Return the
+        ZipInfo of the new member."""
+        if isinstance(name, ZipInfo):
+            src_info = name
+        else:
+            src_info = source.getinfo(name)
+
+        if not self.fp:
+            raise ValueError(
+                "Attempt to write to ZIP archive that was already closed")
+        if self._writing:
+            raise ValueError(
+                "Can't write to ZIP archive while an open writing handle exists."
+            )
+
+        zinfo = copy.copy(src_info)
+        # A ZIP64 record is added again by FileHeader() when the sizes need it
+        zinfo.extra = _strip_extra(zinfo.extra, (1,))
+        zip64 = zinfo.file_size > ZIP64_LIMIT or zinfo.compress_size > ZIP64_LIMIT
+
+        source._fileRefCnt += 1
+        src = _SharedFile(source.fp, src_info.header_offset, source._fpclose,
+                          source._lock, lambda: source._writing)
+        try:
+            fheader = src.read(sizeFileHeader)
+            if len(fheader) != sizeFileHeader:
+                raise BadZipFile("Truncated file header")
+            fheader = struct.unpack(structFileHeader, fheader)
+            if fheader[_FH_SIGNATURE] != stringFileHeader:
+                raise BadZipFile("Bad magic number for file header")
+            src.read(fheader[_FH_FILENAME_LENGTH] + fheader[_FH_EXTRA_FIELD_LENGTH])
+
+            with self._lock:
+                if self._seekable:
+                    self.fp.seek(self.start_dir)
+                zinfo.header_offset = self.fp.tell()
+                self._writecheck(zinfo)
+                self._didModify = True
+
+                self.fp.write(zinfo.FileHeader(zip64))
+                remaining = zinfo.compress_size
+                while remaining > 0:
+                    data = src.read(min(remaining, 1 << 16))
+                    if not data:
+                        raise BadZipFile("Truncated file data")
+                    self.fp.write(data)
+                    remaining -= len(data)
+                if zinfo.flag_bits & 0x08:
+                    # The header has no CRC and sizes, write them after the data
+                    fmt = '<LQQ' if zip64 else '<LLL'
+                    self.fp.write(struct.pack(fmt, zinfo.CRC,
+                        zinfo.compress_size, zinfo.file_size))
+
+                self.filelist.append(zinfo)
+                self.NameToInfo[zinfo.filename] = zinfo
+                self.start_dir = self.fp.tell()
+        finally:
+            src.close()
+        return zinfo
+
     def __del__(self):
         """Call the "close()" method in case the user forgot."""
         self.close()
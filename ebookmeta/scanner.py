@@ -0,0 +1,59 @@
+import os
+from fnmatch import fnmatchcase
+
+from . import _get_metadata, _check_fields
+from .exceptions import UnknownFormatException
+
+PATTERNS = ('*.fb2', '*.zip', '*.epub')
+
+
+def scan(root, patterns=PATTERNS, fields=None, follow_symlinks=False, onerror=None):
+    fields = _check_fields(fields)
+    # With patterns=None every file is checked, the format is detected from the content
+    patterns = [p.lower() for p in patterns] if patterns is not None else None
+    seen_files = set()
+    seen_dirs = set()
+    stack = [root]
+
+    while stack:
+        path = stack.pop()
+        try:
+            entries = os.scandir(path)
+        except OSError as e:
+            if onerror is None:
+                raise
+            onerror(path, e)
+            continue
+
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=follow_symlinks):
+                        if follow_symlinks:
+                            # Symlinked directories may form a loop
+                            st = entry.stat()
+                            if (st.st_dev, st.st_ino) in seen_dirs:
+                                continue
+                            seen_dirs.add((st.st_dev, st.st_ino))
+                        stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=follow_symlinks):
+                        continue
+                    name = entry.name.lower()
+                    if patterns is not None and not any(fnmatchcase(name, p) for p in patterns):
+                        continue
+                    # DirEntry caches the stat result, it is reused for file times
+                    st = entry.stat(follow_symlinks=follow_symlinks)
+                    if st.st_nlink > 1:
+                        if (st.st_dev, st.st_ino) in seen_files:
+                            continue
+                        seen_files.add((st.st_dev, st.st_ino))
+                    meta = _get_metadata(entry.path, fields, st)
+                except UnknownFormatException:
+                    continue
+                except Exception as e:
+                    if onerror is None:
+                        raise
+                    onerror(entry.path, e)
+                    continue
+                yield meta
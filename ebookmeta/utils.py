@@ -4,6 +4,13 @@ import sys
 import pathlib
 import datetime
 import locale
+import shutil
+import tempfile
+
+# Policy for books saved in place: flush the new file (and its directory) to disk
+# before it replaces the old one, and keep the access and modification times
+FSYNC = True
+KEEP_TIMES = False
 
 
 def xstr(string):
@@ -13,6 +20,22 @@ def xstr(string):
         return str(string)
 
 
+def first_text(node):
+    # First text node directly under the element, the same one the text() XPath step selects
+    if node.text is not None:
+        return node.text
+    for child in node:
+        if child.tail is not None:
+            return child.tail
+
+
+def select_fields(values, fields):
+    # The part of a get_fields() result the caller asked for, all of it if fields is None
+    if fields is None:
+        return values
+    return {key: value for key, value in values.items() if key in fields}
+
+
 def str_to_list(s):
     if s:
         s = s.strip()
@@ -125,17 +148,63 @@ def normalize_path(path):
     return str(pathlib.Path(*clean_p))
 
 
-def get_file_creation_time(file):
-    time = None
-    if sys.platform == 'win32':
-        time = os.path.getctime(file)
-    elif sys.platform == 'darwin':
-        time = os.stat(file).st_birthtime
+def get_file_creation_time(file, st=None):
+    if st is None:
+        st = os.stat(file)
+    if sys.platform == 'darwin':
+        time = st.st_birthtime
     else:
-        time = os.path.getctime(file)
+        time = st.st_ctime
+
+    return datetime.datetime.fromtimestamp(time).isoformat()
 
+def get_file_modified_time(file, st=None):
+    if st is None:
+        st = os.stat(file)
+    time = st.st_mtime
     return datetime.datetime.fromtimestamp(time).isoformat()
 
-def get_file_modified_time(file):
-    time = os.stat(file).st_mtime
-    return datetime.datetime.fromtimestamp(time).isoformat()
\ No newline at end of file
+
+def same_file(path, other):
+    # Whether two file names point at one file: another spelling of the path, a symlink or a hard link
+    if not isinstance(path, str) or not isinstance(other, str):
+        return False
+    try:
+        return os.path.samefile(path, other)
+    except OSError:
+        return False
+
+
+def replace_file(path, write, fsync=None, keep_times=None):
+    # write(f) fills a temporary file next to path, which then takes its place in one rename,
+    # so after a crash the book is either the old or the new one. A symlink is followed and
+    # its target replaced; other hard links to the file keep the old content.
+    fsync = FSYNC if fsync is None else fsync
+    keep_times = KEEP_TIMES if keep_times is None else keep_times
+    path = os.path.realpath(path)
+    dir_name = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=dir_name)
+    try:
+        with os.fdopen(fd, 'w+b') as f:
+            write(f)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+            if keep_times:
+                st = os.stat(path)
+                os.utime(temp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        # Make the rename itself durable
+        dir_fd = os.open(dir_name, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
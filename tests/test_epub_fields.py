@@ -0,0 +1,82 @@
+import unittest
+import zipfile
+from io import BytesIO
+
+from ebookmeta.formats import open_ebook
+
+GETTERS = ['identifier', 'title', 'author_list', 'series', 'series_index', 'lang',
+           'description', 'tag_list', 'translator_list']
+
+OPF = '''<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="{0}" unique-identifier="id">
+<metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+{1}
+</metadata><manifest/></package>'''
+
+CONTAINER = '''<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+<rootfiles><rootfile full-path="content.opf"/></rootfiles></container>'''
+
+# Hand-written <metadata> bodies for the rules the single getters follow: the first match wins,
+# a missing content attribute, text() after comments, refines roles and title types
+CASES = {
+    'empty': '',
+    'title_types': '<dc:title id="t1">Sub</dc:title><dc:title id="t2">Main</dc:title>'
+                   '<meta refines="#t1" property="title-type">subtitle</meta>'
+                   '<meta refines="#t2" property="title-type">main</meta>',
+    'subtitle_only': '<dc:title id="t1">Sub</dc:title><meta refines="#t1" property="title-type">subtitle</meta>',
+    'opf_roles': '<dc:creator>A</dc:creator><dc:creator opf:role="aut">B</dc:creator>'
+                 '<dc:creator opf:role="trl">T</dc:creator><dc:creator role="trl">X</dc:creator>'
+                 '<dc:creator opf:role="edt">E</dc:creator>',
+    'refines_roles': '<dc:creator id="c1">A</dc:creator><meta refines="#c1" property="role">trl</meta>'
+                     '<meta refines="#c1" property="role">aut</meta><dc:creator id="c2">B</dc:creator>'
+                     '<meta refines="#c2" property="role">edt</meta><dc:creator>C</dc:creator>',
+    'missing_content': '<meta name="calibre:series"/><meta name="calibre:series" content="S"/>'
+                       '<meta name="calibre:series_index" content="3"/><meta name="cover" content="cov"/>',
+    'text_after_comment': '<dc:description/><dc:description><!-- c -->tail<b>x</b></dc:description>'
+                          '<dc:identifier></dc:identifier><dc:identifier>ID2</dc:identifier>',
+    'first_language': '<dc:language/><dc:language>en</dc:language><dc:subject>a</dc:subject>'
+                      '<dc:subject/><!-- c --><dc:subject>b</dc:subject>',
+    'element_only': '<dc:description><p>inner</p></dc:description>',
+}
+
+
+def make_epub(version, metadata):
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, 'w') as z:
+        z.writestr('mimetype', 'application/epub+zip')
+        z.writestr('META-INF/container.xml', CONTAINER)
+        z.writestr('content.opf', OPF.format(version, metadata))
+    return buf.getvalue()
+
+
+class GetFieldsTest(unittest.TestCase):
+    def check(self, version):
+        for name, metadata in CASES.items():
+            ebook = open_ebook(make_epub(version, metadata))
+            fields = ebook.get_fields()
+            for field in GETTERS:
+                with self.subTest(case=name, field=field):
+                    self.assertEqual(fields[field], getattr(ebook, 'get_' + field)())
+
+    def test_epub2(self):
+        self.check('2.0')
+
+    def test_epub3(self):
+        self.check('3.0')
+
+    def test_projection(self):
+        for version in ('2.0', '3.0'):
+            ebook = open_ebook(make_epub(version, CASES['refines_roles']))
+            for field in GETTERS:
+                with self.subTest(version=version, field=field):
+                    self.assertEqual(ebook.get_fields({field}), {field: getattr(ebook, 'get_' + field)()})
+
+    def test_epub3_refines(self):
+        ebook = open_ebook(make_epub('3.0', CASES['refines_roles']))
+        fields = ebook.get_fields()
+        self.assertEqual(fields['author_list'], ['A', 'C'])
+        self.assertEqual(fields['translator_list'], ['A'])
+
+
+if __name__ == '__main__':
+    unittest.main()
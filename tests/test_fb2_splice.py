@@ -0,0 +1,49 @@
+import unittest
+
+import ebookmeta
+
+FB2 = '''<?xml version="1.0" encoding="utf-8"?>
+<FictionBook xmlns="http://www.gribuser.ru/xml/fictionbook/2.0" xmlns:l="http://www.w3.org/1999/xlink">
+<description><title-info><book-title>Old</book-title><annotation><p>Some {0} text</p></annotation>
+<coverpage><image l:href="#cover.png"/></coverpage></title-info></description>
+<body><section><p>Text</p></section></body>
+<binary id="other.png" content-type="image/png">AAAA</binary>
+<binary id="cover.png" content-type="image/png">BBBB</binary>
+</FictionBook>'''
+
+
+def save_with_title(data, title):
+    meta = ebookmeta.get_metadata(data)
+    meta.title = title
+    return ebookmeta.set_metadata(data, meta)
+
+
+class SpliceTest(unittest.TestCase):
+    def test_body_copied_as_is(self):
+        data = FB2.format('<b>bold</b>').encode('utf-8')
+        result = save_with_title(data, 'New')
+        self.assertEqual(ebookmeta.get_metadata(result).title, 'New')
+        tail = data[data.index(b'</description>'):]
+        self.assertEqual(result[result.index(b'</description>'):], tail)
+
+    def test_unclosed_tag_in_header(self):
+        # The recovering parser ends <description> past the body, the book must not be duplicated
+        data = FB2.format('<b>bold').encode('utf-8')
+        result = save_with_title(data, 'New')
+        self.assertEqual(ebookmeta.get_metadata(result).title, 'New')
+        self.assertEqual(result.count(b'<body'), 1)
+        self.assertEqual(result.count(b'<binary'), 2)
+
+    def test_changed_cover_after_empty_binary(self):
+        data = FB2.format('').replace('<binary id="other.png" content-type="image/png">AAAA</binary>',
+                                      '<binary id="other.png" content-type="image/png"/>').encode('utf-8')
+        meta = ebookmeta.get_metadata(data)
+        meta.cover_image_data = b'new cover'
+        result = ebookmeta.set_metadata(data, meta)
+        self.assertEqual(ebookmeta.get_metadata(result).cover_image_data, b'new cover')
+        self.assertIn(b'<binary id="other.png" content-type="image/png"/>', result)
+        self.assertEqual(result.count(b'<binary'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()